@@ -12,6 +12,11 @@ import razorpay
 import hmac
 import hashlib
 import random
+import functools
+import threading
+import time
+import uuid
+from collections import deque
 
 RAZORPAY_KEY_ID = os.getenv("RAZORPAY_KEY_ID")
 RAZORPAY_KEY_SECRET = os.getenv("RAZORPAY_KEY_SECRET")
@@ -658,6 +663,281 @@ def get_all_payments():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# ADMIN CHANGE FEED - In-memory view of businesses and recent payments, kept
+# current by Firestore snapshot listeners. Admin panels get the full view once
+# and then only deltas over a single SSE connection, so they never refetch the
+# collections. The view is per process: a cursor only resumes on the instance
+# that issued it, any other instance answers with a fresh snapshot.
+ADMIN_FEED_PAYMENTS_LIMIT = int(os.getenv('ADMIN_FEED_PAYMENTS_LIMIT', 200))
+ADMIN_FEED_BACKLOG = int(os.getenv('ADMIN_FEED_BACKLOG', 1000))
+ADMIN_FEED_MAX_STREAMS = int(os.getenv('ADMIN_FEED_MAX_STREAMS', 8))  # must stay well below gunicorn --threads
+ADMIN_FEED_KEEPALIVE = 15  # seconds between SSE keepalive comments
+ADMIN_FEED_STREAM_LIFETIME = 240  # seconds, below the Cloud Run request timeout; EventSource resumes via Last-Event-ID
+ADMIN_FEED_READY_TIMEOUT = 20  # seconds to wait for the first snapshots before giving up
+
+admin_feed = {
+    'epoch': uuid.uuid4().hex[:8],  # renewed whenever the listeners restart, so older cursors are rejected
+    'version': 0,
+    'events': deque(maxlen=ADMIN_FEED_BACKLOG),
+    'businesses': {},
+    'payments': {},
+    'cond': threading.Condition(),
+    'start_lock': threading.Lock(),
+    'watches': [],
+    'failed': False,
+    'businesses_ready': threading.Event(),
+    'payments_ready': threading.Event(),
+    'streams': 0,
+}
+
+def admin_feed_cursor(epoch, version):
+    return f"{epoch}-{version}"
+
+def parse_admin_feed_cursor(cursor):
+    """Return the version encoded in a cursor, or None if it belongs to another epoch or is malformed."""
+    epoch, _, version = (cursor or '').partition('-')
+    if epoch != admin_feed['epoch'] or not version.isdigit():
+        return None
+    return int(version)
+
+def publish_admin_event(event, data):
+    # Caller must hold admin_feed['cond']
+    admin_feed['version'] += 1
+    admin_feed['events'].append((admin_feed['version'], event, data))
+    admin_feed['cond'].notify_all()
+
+def admin_events_since(version):
+    """Return events newer than version, or None if the backlog no longer reaches back that far."""
+    events = admin_feed['events']
+    if version > admin_feed['version']:
+        return None
+    if version == admin_feed['version']:
+        return []
+    if not events or events[0][0] > version + 1:
+        return None
+    return [e for e in events if e[0] > version]
+
+def format_admin_payment(payment_id, p):
+    # Same shape as /api/payments. The panel shows the live name from its businesses map;
+    # business_name is only the fallback for businesses that no longer exist.
+    business = admin_feed['businesses'].get(p.get('slug', ''))
+    business_name = business.get('name', 'Unknown') if business else p.get('business_name') or 'Unknown'
+
+    ts = p.get('timestamp')
+    unit_price = 0
+    if p.get('credits', 0) > 0:
+        unit_price = p.get('amount', 0) / p.get('credits', 1)
+
+    return {
+        'id': payment_id,
+        'business_name': business_name,
+        'slug': p.get('slug', ''),
+        'credits': p.get('credits', 0),
+        'amount': p.get('amount', 0),
+        'unit_price': unit_price,
+        'razorpay_payment_id': p.get('razorpay_payment_id', ''),
+        'timestamp': ts.strftime('%d %b %Y • %I:%M %p') if ts else 'N/A',
+        'sort_key': ts.isoformat() if ts else ''
+    }
+
+def admin_feed_snapshot():
+    # Caller must hold admin_feed['cond']
+    payments = [format_admin_payment(pid, p) for pid, p in admin_feed['payments'].items()]
+    payments.sort(key=lambda x: x['sort_key'], reverse=True)
+    return {'businesses': list(admin_feed['businesses'].values()), 'payments': payments}
+
+def on_businesses_snapshot(epoch, docs, changes, read_time):
+    with admin_feed['cond']:
+        if admin_feed['epoch'] != epoch:
+            return  # late callback from a listener that was already replaced
+        try:
+            initial = not admin_feed['businesses_ready'].is_set()
+            for change in changes:
+                slug = change.document.id
+                if change.type.name == 'REMOVED':
+                    admin_feed['businesses'].pop(slug, None)
+                    if not initial:
+                        publish_admin_event('business.deleted', {'slug': slug})
+                    continue
+
+                new = change.document.to_dict()
+                new['slug'] = slug
+                old = admin_feed['businesses'].get(slug)
+                admin_feed['businesses'][slug] = new
+                if initial:
+                    continue
+
+                if old is None:
+                    publish_admin_event('business.created', new)
+                    continue
+                changed = {k for k in set(old) | set(new) if old.get(k) != new.get(k)}
+                if changed == {'credit_balance'}:
+                    publish_admin_event('business.credits', {'slug': slug, 'credit_balance': new['credit_balance']})
+                elif changed:
+                    publish_admin_event('business.updated', new)
+        except Exception as e:
+            print(f"Admin change feed businesses listener failed: {e}")
+            admin_feed['failed'] = True
+            return
+        admin_feed['businesses_ready'].set()
+
+def on_payments_snapshot(epoch, docs, changes, read_time):
+    with admin_feed['cond']:
+        if admin_feed['epoch'] != epoch:
+            return  # late callback from a listener that was already replaced
+        try:
+            initial = not admin_feed['payments_ready'].is_set()
+            for change in changes:
+                payment_id = change.document.id
+                if change.type.name == 'REMOVED':
+                    # Deleted, or pushed out of the recent-payments window
+                    admin_feed['payments'].pop(payment_id, None)
+                    if not initial:
+                        publish_admin_event('payment.removed', {'id': payment_id})
+                    continue
+
+                existed = payment_id in admin_feed['payments']
+                admin_feed['payments'][payment_id] = change.document.to_dict()
+                if not initial:
+                    payment = format_admin_payment(payment_id, admin_feed['payments'][payment_id])
+                    publish_admin_event('payment.updated' if existed else 'payment.created', payment)
+        except Exception as e:
+            print(f"Admin change feed payments listener failed: {e}")
+            admin_feed['failed'] = True
+            return
+        admin_feed['payments_ready'].set()
+
+def admin_feed_healthy():
+    return not admin_feed['failed'] and all(watch.is_active for watch in admin_feed['watches'])
+
+def start_admin_feed():
+    with admin_feed['start_lock']:
+        if admin_feed['watches']:
+            return
+        epoch = admin_feed['epoch']
+        recent_payments = db.collection('payments').order_by(
+            'timestamp', direction=firestore.Query.DESCENDING
+        ).limit(ADMIN_FEED_PAYMENTS_LIMIT)
+
+        watches = []
+        try:
+            watches.append(db.collection('businesses').on_snapshot(functools.partial(on_businesses_snapshot, epoch)))
+            watches.append(recent_payments.on_snapshot(functools.partial(on_payments_snapshot, epoch)))
+        except Exception:
+            for watch in watches:
+                watch.unsubscribe()
+            raise
+        admin_feed['watches'] = watches
+        print("Admin change feed listeners started")
+
+def reset_admin_feed(epoch, reason):
+    """Stop the listeners and drop the view so the next request starts them again.
+
+    Does nothing if the feed was already reset since epoch was read.
+    """
+    with admin_feed['start_lock']:
+        with admin_feed['cond']:
+            if admin_feed['epoch'] != epoch:
+                return
+            watches = admin_feed['watches']
+            admin_feed.update(epoch=uuid.uuid4().hex[:8], version=0, watches=[], failed=False, businesses={}, payments={})
+            admin_feed['events'].clear()
+            admin_feed['businesses_ready'].clear()
+            admin_feed['payments_ready'].clear()
+            admin_feed['cond'].notify_all()
+    print(f"Admin change feed reset: {reason}")
+
+    for watch in watches:
+        try:
+            watch.unsubscribe()
+        except Exception as e:
+            print(f"Admin change feed listener did not stop cleanly: {e}")
+
+def ensure_admin_feed():
+    """Start or restart the listeners and wait for their first snapshots. Return False if they are not ready in time."""
+    if admin_feed['watches'] and not admin_feed_healthy():
+        reset_admin_feed(admin_feed['epoch'], 'listener stopped')
+
+    try:
+        start_admin_feed()
+    except Exception as e:
+        print(f"Admin change feed listeners could not start: {e}")
+        return False
+
+    epoch = admin_feed['epoch']
+    deadline = time.monotonic() + ADMIN_FEED_READY_TIMEOUT
+    for ready in (admin_feed['businesses_ready'], admin_feed['payments_ready']):
+        if not ready.wait(max(0, deadline - time.monotonic())):
+            reset_admin_feed(epoch, 'first snapshot timed out')
+            return False
+    return True
+
+@app.route('/api/admin/changes', methods=['GET'])
+def admin_changes():
+    if not db:
+        return jsonify({'error': 'Database not available'}), 503
+    if 'user' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    # Every open stream holds a worker thread, so leave the rest for customer and webhook traffic
+    with admin_feed['cond']:
+        if admin_feed['streams'] >= ADMIN_FEED_MAX_STREAMS:
+            return jsonify({'error': 'Too many admin streams, try again later'}), 503
+        admin_feed['streams'] += 1
+
+    def release_stream():
+        with admin_feed['cond']:
+            admin_feed['streams'] -= 1
+
+    # EventSource sends Last-Event-ID on reconnect; the query cursor is only used for the first connection
+    cursor = request.headers.get('Last-Event-ID') or request.args.get('cursor')
+
+    def stream():
+        yield 'retry: 3000\n\n'
+        with admin_feed['cond']:
+            epoch = admin_feed['epoch']
+            last = parse_admin_feed_cursor(cursor)
+
+        deadline = time.monotonic() + ADMIN_FEED_STREAM_LIFETIME
+        while time.monotonic() < deadline:
+            if last is not None and not admin_feed_healthy():
+                last = None
+
+            if last is None:
+                # Unknown cursor (new panel, other instance, trimmed backlog or restarted
+                # listeners): send the full view on this same connection
+                if not ensure_admin_feed():
+                    yield 'event: reset\ndata: {}\n\n'
+                    return
+                with admin_feed['cond']:
+                    epoch, last = admin_feed['epoch'], admin_feed['version']
+                    snapshot = admin_feed_snapshot()
+                yield f"id: {admin_feed_cursor(epoch, last)}\nevent: snapshot\ndata: {app.json.dumps(snapshot)}\n\n"
+                continue
+
+            with admin_feed['cond']:
+                pending = admin_events_since(last) if admin_feed['epoch'] == epoch else None
+                if pending == []:
+                    admin_feed['cond'].wait(max(0, min(ADMIN_FEED_KEEPALIVE, deadline - time.monotonic())))
+                    pending = admin_events_since(last) if admin_feed['epoch'] == epoch else None
+
+            if pending is None:
+                last = None
+                continue
+            if not pending:
+                yield ': keepalive\n\n'
+                continue
+            for version, event, data in pending:
+                yield f"id: {admin_feed_cursor(epoch, version)}\nevent: {event}\ndata: {app.json.dumps(data)}\n\n"
+                last = version
+
+    response = app.response_class(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    response.call_on_close(release_stream)
+    return response
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8080))
     app.run(host='0.0.0.0', port=port, debug=False)
@@ -0,0 +1,206 @@
+import json
+from collections import deque
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from google.cloud.firestore_v1.watch import ChangeType
+
+import app
+
+
+def change(change_type, doc_id, data=None):
+    return SimpleNamespace(
+        type=change_type,
+        document=SimpleNamespace(id=doc_id, to_dict=lambda: dict(data or {})),
+    )
+
+
+def businesses(*changes):
+    app.on_businesses_snapshot(app.admin_feed['epoch'], None, list(changes), None)
+
+
+def payments(*changes):
+    app.on_payments_snapshot(app.admin_feed['epoch'], None, list(changes), None)
+
+
+def published():
+    return [(event, data) for _, event, data in app.admin_feed['events']]
+
+
+@pytest.fixture(autouse=True)
+def fresh_feed():
+    app.reset_admin_feed(app.admin_feed['epoch'], 'test')
+    yield
+    app.reset_admin_feed(app.admin_feed['epoch'], 'test')
+
+
+@pytest.fixture
+def loaded_feed():
+    businesses(change(ChangeType.ADDED, 'cafe', {'name': 'Cafe', 'credit_balance': 5}))
+    payments()
+
+
+def test_parse_cursor_accepts_current_epoch_only():
+    epoch = app.admin_feed['epoch']
+    assert app.parse_admin_feed_cursor(app.admin_feed_cursor(epoch, 7)) == 7
+    assert app.parse_admin_feed_cursor(app.admin_feed_cursor('other', 7)) is None
+    assert app.parse_admin_feed_cursor(f'{epoch}-x') is None
+    assert app.parse_admin_feed_cursor('') is None
+    assert app.parse_admin_feed_cursor(None) is None
+
+
+def test_events_since_detects_trimmed_backlog(monkeypatch):
+    monkeypatch.setitem(app.admin_feed, 'events', deque(maxlen=2))
+    with app.admin_feed['cond']:
+        for i in range(4):
+            app.publish_admin_event('business.deleted', {'slug': str(i)})
+
+    assert [v for v, _, _ in app.admin_events_since(2)] == [3, 4]
+    assert app.admin_events_since(4) == []
+    assert app.admin_events_since(1) is None  # event 2 was trimmed
+    assert app.admin_events_since(5) is None
+
+
+def test_initial_snapshot_publishes_nothing(loaded_feed):
+    assert published() == []
+    assert app.admin_feed['businesses']['cafe']['slug'] == 'cafe'
+    assert app.admin_feed['businesses_ready'].is_set()
+
+
+def test_business_changes_map_to_events(loaded_feed):
+    businesses(change(ChangeType.MODIFIED, 'cafe', {'name': 'Cafe', 'credit_balance': 4}))
+    businesses(change(ChangeType.MODIFIED, 'cafe', {'name': 'Cafe', 'credit_balance': 4}))
+    businesses(change(ChangeType.MODIFIED, 'cafe', {'name': 'Cafe Two', 'credit_balance': 3}))
+    businesses(change(ChangeType.ADDED, 'gym', {'name': 'Gym'}))
+    businesses(change(ChangeType.REMOVED, 'cafe'))
+
+    assert published() == [
+        ('business.credits', {'slug': 'cafe', 'credit_balance': 4}),
+        ('business.updated', {'name': 'Cafe Two', 'credit_balance': 3, 'slug': 'cafe'}),
+        ('business.created', {'name': 'Gym', 'slug': 'gym'}),
+        ('business.deleted', {'slug': 'cafe'}),
+    ]
+
+
+def test_payment_changes_map_to_events(loaded_feed):
+    payments(change(ChangeType.ADDED, 'p1', {'slug': 'cafe', 'credits': 2, 'amount': 20}))
+    payments(change(ChangeType.REMOVED, 'p1'))
+
+    (created, payment), removed = published()
+    assert created == 'payment.created'
+    assert payment['business_name'] == 'Cafe'
+    assert payment['unit_price'] == 10
+    assert removed == ('payment.removed', {'id': 'p1'})
+    assert 'p1' not in app.admin_feed['payments']
+
+
+def test_snapshot_sorts_payments_newest_first(loaded_feed):
+    payments(
+        change(ChangeType.ADDED, 'old', {'slug': 'cafe', 'timestamp': datetime(2025, 1, 1, tzinfo=timezone.utc)}),
+        change(ChangeType.ADDED, 'new', {'slug': 'gone', 'business_name': 'Gone', 'timestamp': datetime(2025, 2, 1, tzinfo=timezone.utc)}),
+    )
+    with app.admin_feed['cond']:
+        snapshot = app.admin_feed_snapshot()
+
+    assert [(p['id'], p['business_name']) for p in snapshot['payments']] == [('new', 'Gone'), ('old', 'Cafe')]
+
+
+def test_callback_from_replaced_listener_is_ignored(loaded_feed):
+    app.on_businesses_snapshot('stale', None, [change(ChangeType.REMOVED, 'cafe')], None)
+    assert 'cafe' in app.admin_feed['businesses']
+    assert published() == []
+
+
+def test_callback_failure_marks_feed_unhealthy(loaded_feed):
+    businesses(SimpleNamespace(type=None, document=SimpleNamespace(id='broken')))
+    assert not app.admin_feed_healthy()
+
+
+def test_reset_renews_epoch_and_clears_view(loaded_feed):
+    epoch = app.admin_feed['epoch']
+    app.reset_admin_feed(epoch, 'test')
+
+    assert app.admin_feed['epoch'] != epoch
+    assert app.admin_feed['businesses'] == {}
+    assert not app.admin_feed['businesses_ready'].is_set()
+    new_epoch = app.admin_feed['epoch']
+    app.reset_admin_feed(epoch, 'already reset')  # stale epoch is a no-op
+    assert app.admin_feed['epoch'] == new_epoch
+
+
+@pytest.fixture
+def client(monkeypatch, loaded_feed):
+    monkeypatch.setattr(app, 'db', object())
+    monkeypatch.setattr(app, 'start_admin_feed', lambda: None)
+    monkeypatch.setattr(app, 'ADMIN_FEED_STREAM_LIFETIME', 0.2)
+    monkeypatch.setattr(app, 'ADMIN_FEED_KEEPALIVE', 0.05)
+    client = app.app.test_client()
+    with client.session_transaction() as session:
+        session['user'] = 'admin'
+    return client
+
+
+def sse_events(body):
+    events = []
+    for block in body.split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines() if ': ' in line and not line.startswith(':'))
+        if 'event' in fields:
+            events.append(fields)
+    return events
+
+
+def test_stream_without_cursor_starts_with_snapshot(client):
+    response = client.get('/api/admin/changes')
+    events = sse_events(response.get_data(as_text=True))
+    response.close()
+
+    assert events[0]['event'] == 'snapshot'
+    assert events[0]['id'] == app.admin_feed_cursor(app.admin_feed['epoch'], 0)
+    assert [b['slug'] for b in json.loads(events[0]['data'])['businesses']] == ['cafe']
+    assert app.admin_feed['streams'] == 0
+
+
+def test_stream_resumes_from_cursor(client):
+    businesses(change(ChangeType.MODIFIED, 'cafe', {'name': 'Cafe', 'credit_balance': 1}))
+    businesses(change(ChangeType.REMOVED, 'cafe'))
+    cursor = app.admin_feed_cursor(app.admin_feed['epoch'], 1)
+
+    response = client.get('/api/admin/changes', headers={'Last-Event-ID': cursor})
+    events = sse_events(response.get_data(as_text=True))
+    response.close()
+
+    assert [(e['id'], e['event']) for e in events] == [
+        (app.admin_feed_cursor(app.admin_feed['epoch'], 2), 'business.deleted'),
+    ]
+
+
+def test_stream_from_other_instance_gets_snapshot(client):
+    response = client.get('/api/admin/changes?cursor=other-3')
+    events = sse_events(response.get_data(as_text=True))
+    response.close()
+
+    assert events[0]['event'] == 'snapshot'
+
+
+def test_stream_sends_reset_when_feed_never_loads(client, monkeypatch):
+    monkeypatch.setattr(app, 'ADMIN_FEED_READY_TIMEOUT', 0.01)
+    app.reset_admin_feed(app.admin_feed['epoch'], 'test')
+    epoch = app.admin_feed['epoch']
+
+    response = client.get('/api/admin/changes')
+    events = sse_events(response.get_data(as_text=True))
+    response.close()
+
+    assert [e['event'] for e in events] == ['reset']
+    assert app.admin_feed['epoch'] != epoch  # next request starts the listeners again
+
+
+def test_extra_streams_are_refused(client, monkeypatch):
+    monkeypatch.setitem(app.admin_feed, 'streams', app.ADMIN_FEED_MAX_STREAMS)
+    assert client.get('/api/admin/changes').status_code == 503
+
+
+def test_stream_requires_login(monkeypatch):
+    monkeypatch.setattr(app, 'db', object())
+    assert app.app.test_client().get('/api/admin/changes').status_code == 401